@@ -0,0 +1,70 @@
+import argparse
+import json
+import logging
+import pathlib
+
+from src.benchmark import load_positions, run_bot, summarize
+
+
+def print_summary(summary: dict):
+    line = (
+        f"{summary['bot']}: {summary['positions']} positions, "
+        f"p50 {summary['p50'] * 1000:.1f}ms, p90 {summary['p90'] * 1000:.1f}ms, "
+        f"p99 {summary['p99'] * 1000:.1f}ms, max {summary['max'] * 1000:.1f}ms, "
+        f"timeouts {summary['timeouts']} (hung {summary['hung']}), errors {summary['errors']}, "
+        f"memory growth {summary['memoryGrowthKb']}KB"
+    )
+    if 'agreement' in summary:
+        line += f", agreement with reference {summary['agreement']:.1%}"
+    print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        'bots', nargs='+',
+        help='paths to python files with Bot class',
+    )
+    parser.add_argument(
+        '-g', '--games', nargs='+', required=True,
+        help='recorded games (json output of playGame.py) or directories with them',
+    )
+    parser.add_argument(
+        '-r', '--reference',
+        help='path to reference bot. agreement of moves with it is reported',
+    )
+    parser.add_argument(
+        '--last', type=int,
+        help='take only last N iterations of every game (crowded late-game boards)',
+    )
+    parser.add_argument(
+        '-t', '--timeout', type=float, default=1,
+        help='time budget of one decision in seconds. default is 1',
+    )
+    parser.add_argument(
+        '-p', '--processes', type=int,
+        help='number of processes per bot. default is number of cores',
+    )
+    parser.add_argument(
+        '-o', '--output', type=pathlib.Path,
+        help='path to output summaries and errors in json format',
+    )
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    positions = load_positions(args.games, last=args.last)
+    logging.info(f"Benchmark on {len(positions)} positions")
+
+    # bots run one after another, so they do not compete for cores
+    reference = run_bot(args.reference, positions, processes=args.processes) if args.reference else None
+
+    output = []
+    for botPath in args.bots:
+        run = run_bot(botPath, positions, processes=args.processes)
+        summary = summarize(run, timeout=args.timeout, reference=reference)
+        print_summary(summary)
+        output.append({'summary': summary, 'errors': run['errors']})
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(output, file, indent=4)
@@ -0,0 +1,32 @@
+import argparse
+import logging
+import pathlib
+
+import src.constants as constants
+from src import openingBook
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '-o', '--output', type=pathlib.Path, default='opening.book',
+        help='path to output book. default is opening.book',
+    )
+    parser.add_argument(
+        '--plies', type=int, default=3,
+        help='number of first game iterations covered by the book. default is 3',
+    )
+    parser.add_argument(
+        '--depth', type=int, default=3,
+        help='search depth (in iterations) for every position. default is 3',
+    )
+    parser.add_argument(
+        '-p', '--processes', type=int,
+        help='number of processes. default is number of cores',
+    )
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    entries = openingBook.build(plies=args.plies, depth=args.depth, processes=args.processes)
+    openingBook.write(args.output, entries, *constants.GAME_SIZE)
+    logging.info(f"Wrote {len(entries)} positions to {args.output}")
@@ -0,0 +1,36 @@
+import argparse
+import logging
+
+import src.constants as constants
+from src import tablebase
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--size', type=int, nargs=2, default=constants.GAME_SIZE, metavar=('WIDTH', 'HEIGHT'),
+        help='size of the maze. default is GAME_SIZE from src/constants.py',
+    )
+    parser.add_argument(
+        '--lengths', type=int, nargs=2, default=(constants.SNAKES_INITIAL_SIZE,) * 2,
+        metavar=('LENGTH1', 'LENGTH2'),
+        help='lengths of the snakes. default is SNAKES_INITIAL_SIZE',
+    )
+    parser.add_argument(
+        '-o', '--output',
+        help='path to the table. default is tablebase_<width>x<height>_<length1>_<length2>.tb',
+    )
+    parser.add_argument(
+        '-p', '--processes', type=int,
+        help='number of processes. default is number of cores',
+    )
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    width, height = args.size
+    length1, length2 = args.lengths
+    if width * height > 36:
+        logging.warning(f"Maze {width}x{height} is large, the table may not fit into memory and disk")
+
+    output = args.output or f"tablebase_{width}x{height}_{length1}_{length2}.tb"
+    tablebase.generate(output, width, height, length1, length2, processes=args.processes)
@@ -0,0 +1,80 @@
+"""
+Check that `src.fastGame.step` follows the same rules as `Game.run_one_step`:
+plays random games and compares every iteration of both engines.
+Run it after any change of the game rules
+"""
+import argparse
+import random
+import sys
+
+from src import fastGame
+from src.bot import IBot
+from src.game import Game, GameOver
+from src.geometry import directions
+
+
+class RandomBot(IBot):
+    """
+    Mostly safe random moves, sometimes any move (to check deaths too)
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.move = None
+
+    def chooseDirection(self, snake, opponent, mazeSize, apple):
+        state = fastGame.from_snakes(snake, opponent, mazeSize, apple)
+        if random.random() < 0.97:
+            self.move = random.choice(fastGame.safe_moves(state, state.body1))
+        else:
+            self.move = random.randrange(len(directions))
+        return directions[self.move]
+
+
+def check_game() -> str:
+    """
+    Play one game with both engines. Return description of mismatch or None
+    """
+    bot1, bot2 = RandomBot(), RandomBot()
+    game = Game.default_game(bots=(bot1, bot2))
+    while True:
+        state = fastGame.from_game(game)
+        try:
+            game.run_one_step()
+        except GameOver:
+            _, result = fastGame.step(state, bot1.move, bot2.move)
+            if result != game.snakeWinner:
+                return f"iteration {state.iteration}: result {result}, expected {game.snakeWinner} ({game.result_description})"
+            return None
+
+        newState, result = fastGame.step(state, bot1.move, bot2.move)
+        expected = fastGame.from_game(game)
+        if result is not None:
+            return f"iteration {state.iteration}: game ended with {result}, but it continues"
+        if (newState.body1, newState.body2) != (expected.body1, expected.body2):
+            return f"iteration {state.iteration}: bodies differ"
+        # fastGame does not respawn eaten apple
+        if newState.apple != fastGame.NO_APPLE and newState.apple != expected.apple:
+            return f"iteration {state.iteration}: apples differ"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '-g', '--games', type=int, default=300,
+        help='number of random games. default is 300',
+    )
+    parser.add_argument('--seed', type=int, default=0)
+
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    mismatches = 0
+    for number in range(args.games):
+        mismatch = check_game()
+        if mismatch:
+            mismatches += 1
+            print(f"Game {number}: {mismatch}")
+
+    print(f"{mismatches} mismatches in {args.games} games")
+    sys.exit(1 if mismatches else 0)
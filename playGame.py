@@ -9,16 +9,21 @@ import src.constants as constants
 from src import IBot
 from src.game import Game, GameOver
 from src.importsTools import import_bot
+from src import snapshot as snapshots
 
 
-def play_one_game(bot1: IBot, bot2: IBot, show=0) -> dict:
+def play_one_game(bot1: IBot, bot2: IBot, show=0, snapshot: dict = None) -> dict:
     """
-    Plays game between two bots
+    Plays game between two bots.
+    If snapshot is given, game continues from it instead of initial position
 
     Return info about the game in json format
     """
     logging.debug(f"Play game between {bot1._name} and {bot2._name}")
-    game = Game.default_game(bots=(bot1, bot2))
+    if snapshot:
+        game = Game.from_snapshot(snapshot, bots=(bot1, bot2))
+    else:
+        game = Game.default_game(bots=(bot1, bot2))
 
     # run game using python iterations
     gameIter = game.__iter__()
@@ -52,12 +57,36 @@ if __name__ == "__main__":
         '-o', '--output', type=pathlib.Path,
         help='path to output states of game. default is game.json',
     )
+    parser.add_argument(
+        '--snapshot', type=pathlib.Path,
+        help='start game from snapshot file (see src/snapshot.py)',
+    )
+    parser.add_argument(
+        '--replay', type=pathlib.Path,
+        help='start game from position of recorded game (json output of this script)',
+    )
+    parser.add_argument(
+        '--iteration', type=int,
+        help='iteration of --replay to start from. negative value counts from the end. default is 0',
+    )
 
     args = parser.parse_args()
+    if args.iteration is not None and not args.replay:
+        parser.error('--iteration requires --replay')
     bot1_path, bot2_path = args.bots
     bot1, bot2 = import_bot(bot1_path), import_bot(bot2_path)
 
-    states = play_one_game(bot1, bot2, show=args.show)
+    snapshot = None
+    if args.snapshot:
+        snapshot = snapshots.load(args.snapshot)
+    elif args.replay:
+        with open(args.replay) as file:
+            try:
+                snapshot = snapshots.from_replay(json.load(file), args.iteration or 0)
+            except ValueError as e:
+                parser.error(e.__str__())
+
+    states = play_one_game(bot1, bot2, show=args.show, snapshot=snapshot)
 
     if args.output:
         with open(args.output, 'w') as file:
@@ -0,0 +1,58 @@
+import argparse
+import logging
+
+from src import analytics
+
+
+def print_heatmap(heatmap):
+    # the same orientation as in `Game.__str__`: y grows upwards
+    for row in heatmap[::-1]:
+        print(' '.join(f"{count:3d}" if count else '  .' for count in row))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '-s', '--store', default='replays.store',
+        help='directory of the columnar store. default is replays.store',
+    )
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    ingestParser = subparsers.add_parser('ingest', help='add new recorded games to the store')
+    ingestParser.add_argument(
+        'replays', nargs='+', help='recorded games (json output of playGame.py) or directories with them')
+    ingestParser.add_argument(
+        '-p', '--processes', type=int, help='number of processes. default is number of cores')
+
+    reportParser = subparsers.add_parser('report', help='print report')
+    reportParser.add_argument(
+        'report', choices=['deaths', 'survival', 'first-apple', 'heatmap'])
+    reportParser.add_argument(
+        '--reason', choices=analytics.REASONS,
+        help='death reason for heatmap, e.g. head_on. default is all deaths')
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    store = analytics.ReplayStore(args.store)
+
+    if args.command == 'ingest':
+        ingested = store.ingest(args.replays, processes=args.processes)
+        print(f"Ingested {ingested} replays")
+
+    elif args.report == 'deaths':
+        for bot, reasons in sorted(analytics.death_reasons(store.load()[1]).items()):
+            print(f"{bot}: " + ', '.join(f"{reason} {count}" for reason, count in reasons.most_common()))
+
+    elif args.report == 'survival':
+        for bot, curve in sorted(analytics.survival_curves(store.load()[1]).items()):
+            points = [f"{iteration}: {curve[iteration]:.0%}" for iteration in range(0, len(curve), 50)]
+            print(f"{bot}: " + ', '.join(points))
+
+    elif args.report == 'first-apple':
+        steps, games = store.load()
+        for bot, times in sorted(analytics.first_apple_times(steps, games).items()):
+            times.sort()
+            print(f"{bot}: {len(times)} games, min {times[0]}, median {times[len(times) // 2]}, max {times[-1]}")
+
+    elif args.report == 'heatmap':
+        print_heatmap(analytics.death_heatmap(store.load()[1], reason=args.reason))
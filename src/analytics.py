@@ -0,0 +1,386 @@
+"""
+Columnar store of recorded games for analytics.
+
+Ingest converts replays (json output of `playGame.py`) into typed columns
+(`array.array`) of two tables, saved in chunk directories as raw binary files:
+    steps  -- one row for every recorded iteration of every game
+    games  -- one row for every game (result, death reasons and places)
+Queries work on whole columns instead of loading every replay into dicts.
+Ingest is incremental: store remembers ingested files (path, size, mtime).
+A changed replay is ingested again into a new chunk, its old rows are skipped on load
+"""
+import json
+import logging
+import multiprocessing
+import os
+from array import array
+from collections import Counter
+from itertools import compress
+from typing import Dict, List, Sequence, Tuple
+
+from . import constants
+from .utils import find_all_files_with_pattern
+
+MANIFEST = 'manifest.json'
+
+# death reasons of a snake. 'alive' for the snake that did not die
+REASONS = [
+    'alive', 'timeout', 'exception', 'invalid_direction', 'technical',
+    'wall', 'self', 'opponent', 'head_on', 'collision', 'max_iterations',
+]
+
+STEP_COLUMNS = {
+    'game': 'i', 'iteration': 'h',
+    'head1x': 'b', 'head1y': 'b', 'head2x': 'b', 'head2y': 'b',
+    'length1': 'h', 'length2': 'h', 'score1': 'h', 'score2': 'h',
+    'applex': 'b', 'appley': 'b',
+}
+GAME_COLUMNS = {
+    'steps': 'h', 'winner': 'b', 'score1': 'h', 'score2': 'h',
+    'reason1': 'b', 'reason2': 'b',
+    'death1x': 'b', 'death1y': 'b', 'death2x': 'b', 'death2y': 'b',
+}
+# stored in json
+GAME_TEXT_COLUMNS = ['bot1', 'bot2', 'description', 'path']
+
+
+def _parse(value: str) -> Tuple[int, int]:
+    if value in (None, 'None'):
+        return -1, -1
+    x, y = map(int, value.split())
+    return x, y
+
+
+def parse_reason(description: str) -> str:
+    """
+    Return reason of the game end from `metadata.description`
+    """
+    if 'took too long' in description:
+        return 'timeout'
+    if 'Invalid direction' in description:
+        return 'invalid_direction'
+    if 'technical reasons' in description:
+        return 'technical'
+    if 'exceeded the maximum number of iterations' in description:
+        return 'max_iterations'
+    if description.startswith('Both snakes are died') or description.endswith('is dead'):
+        return 'collision'
+    # text of exception raised by the bot
+    return 'exception'
+
+
+def _collision_reason(snake: List[str], opponent: List[str]) -> str:
+    """
+    Refine collision using the final position of the snakes
+    """
+    head = snake[0]
+    x, y = _parse(head)
+    if not (0 <= x < constants.GAME_SIZE[0] and 0 <= y < constants.GAME_SIZE[1]):
+        return 'wall'
+    if head == opponent[0]:
+        return 'head_on'
+    if head in snake[1:]:
+        return 'self'
+    if head in opponent:
+        return 'opponent'
+    return 'collision'
+
+
+def parse_game(path: str) -> dict:
+    """
+    Return rows of both tables for one replay
+    """
+    with open(path) as file:
+        states = json.load(file)
+    metadata = states['metadata']
+
+    steps = {name: [] for name in STEP_COLUMNS}
+    iterations = sorted(int(key) for key in states if key != 'metadata')
+    for iterationNumber in iterations:
+        state = states[str(iterationNumber)]
+        values = (
+            iterationNumber, *_parse(state['snake1'][0]), *_parse(state['snake2'][0]),
+            len(state['snake1']), len(state['snake2']), state['score1'], state['score2'],
+            *_parse(state['apple']),
+        )
+        for name, value in zip(list(STEP_COLUMNS)[1:], values):
+            steps[name].append(value)
+
+    winner = metadata['winner']
+    reason = parse_reason(metadata['description'])
+    # if both snakes died, the one with more points is still the winner
+    bothDead = metadata['description'].startswith('Both snakes are died') or reason == 'max_iterations'
+    dead = {1: bothDead or winner == 2, 2: bothDead or winner == 1}
+
+    game = {
+        'steps': len(iterations), 'winner': winner,
+        'score1': metadata['score'][0], 'score2': metadata['score'][1],
+        'bot1': metadata['team1']['name'], 'bot2': metadata['team2']['name'],
+        'description': metadata['description'], 'path': path,
+    }
+    final = metadata.get('finalState')
+    for number, snake, opponent in ((1, 'snake1', 'snake2'), (2, 'snake2', 'snake1')):
+        snakeReason = reason
+        if not dead[number]:
+            snakeReason = 'alive'
+        elif reason == 'collision' and final:
+            snakeReason = _collision_reason(final[snake], final[opponent])
+        game[f'reason{number}'] = REASONS.index(snakeReason)
+
+        x, y = _parse(final[snake][0]) if final and dead[number] else (-1, -1)
+        game[f'death{number}x'], game[f'death{number}y'] = x, y
+
+    return {'steps': steps, 'game': game, 'hasFinalState': bool(final)}
+
+
+class Table:
+    """
+    Named columns of equal length
+    """
+
+    def __init__(self, columns: Dict[str, Sequence]):
+        self.columns = columns
+
+    def __len__(self):
+        return len(next(iter(self.columns.values()), []))
+
+    def __getitem__(self, name: str) -> Sequence:
+        return self.columns[name]
+
+    def select(self, mask: Sequence[bool]) -> 'Table':
+        """
+        Return rows where mask is true
+        """
+        return Table({
+            name: type(column)(column.typecode, compress(column, mask)) if isinstance(column, array)
+            else list(compress(column, mask))
+            for name, column in self.columns.items()
+        })
+
+    def where(self, **conditions) -> 'Table':
+        """
+        Return rows where columns are equal to given values, e.g. where(reason1=REASONS.index('wall'))
+        """
+        mask = None
+        for name, value in conditions.items():
+            columnMask = [v == value for v in self.columns[name]]
+            mask = columnMask if mask is None else list(map(bool.__and__, mask, columnMask))
+        return self if mask is None else self.select(mask)
+
+
+def _save_columns(directory: str, prefix: str, columns: Dict[str, array]):
+    for name, column in columns.items():
+        with open(os.path.join(directory, f"{prefix}.{name}"), 'wb') as file:
+            column.tofile(file)
+
+
+def _load_columns(directory: str, prefix: str, typecodes: Dict[str, str]) -> Dict[str, array]:
+    columns = {}
+    for name, typecode in typecodes.items():
+        column = array(typecode)
+        path = os.path.join(directory, f"{prefix}.{name}")
+        with open(path, 'rb') as file:
+            column.frombytes(file.read())
+        columns[name] = column
+    return columns
+
+
+class ReplayStore:
+    """
+    Directory with chunks of columns and manifest of ingested replays
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        manifestPath = os.path.join(path, MANIFEST)
+        self.manifest = {'files': {}, 'chunks': []}
+        if os.path.exists(manifestPath):
+            with open(manifestPath) as file:
+                self.manifest = json.load(file)
+
+    def _save_manifest(self):
+        manifestPath = os.path.join(self.path, MANIFEST)
+        with open(manifestPath + '.tmp', 'w') as file:
+            json.dump(self.manifest, file)
+        os.replace(manifestPath + '.tmp', manifestPath)
+
+    def _write_chunk(self, games: List[dict]) -> str:
+        name = f"chunk-{len(self.manifest['chunks']):05d}"
+        directory = os.path.join(self.path, name)
+        os.makedirs(directory, exist_ok=True)
+
+        steps = {column: array(typecode) for column, typecode in STEP_COLUMNS.items()}
+        for number, game in enumerate(games):
+            rows = len(game['steps']['iteration'])
+            steps['game'].extend([number] * rows)
+            for column, values in game['steps'].items():
+                steps[column].extend(values)
+        _save_columns(directory, 'steps', steps)
+
+        gameColumns = {
+            name: array(typecode, (game['game'][name] for game in games))
+            for name, typecode in GAME_COLUMNS.items()
+        }
+        _save_columns(directory, 'games', gameColumns)
+        with open(os.path.join(directory, 'games.json'), 'w') as file:
+            json.dump({name: [game['game'][name] for game in games] for name in GAME_TEXT_COLUMNS}, file)
+
+        return name
+
+    def ingest(self, paths: List[str], processes: int = None, chunkSize: int = 1000) -> int:
+        """
+        Parse new or changed replays in parallel and append them as new chunks.
+        Return number of ingested replays
+        """
+        files = []
+        for path in paths:
+            if os.path.isdir(path):
+                files += sorted(find_all_files_with_pattern(path, r'\.json$', recursive=True))
+            else:
+                files.append(path)
+
+        def signature(path):
+            stat = os.stat(path)
+            return [stat.st_size, stat.st_mtime]
+
+        newFiles = [
+            os.path.abspath(path) for path in files
+            if self.manifest['files'].get(os.path.abspath(path)) != signature(path)
+        ]
+        logging.info(f"{len(newFiles)} new replays of {len(files)}")
+
+        withoutFinalState = 0
+        with multiprocessing.Pool(processes) as pool:
+            for start in range(0, len(newFiles), chunkSize):
+                chunkFiles = newFiles[start:start + chunkSize]
+                games = pool.map(parse_game, chunkFiles)
+                withoutFinalState += sum(not game['hasFinalState'] for game in games)
+                self.manifest['chunks'].append(self._write_chunk(games))
+                for path in chunkFiles:
+                    self.manifest['files'][path] = signature(path)
+                # manifest is saved after the chunk, so interrupted ingest is repeated from this chunk
+                self._save_manifest()
+
+        if withoutFinalState:
+            logging.warning(
+                f"{withoutFinalState} replays have no metadata.finalState (recorded before it was added): "
+                f"their collisions are not split into wall/self/opponent/head_on and death places are unknown")
+        return len(newFiles)
+
+    def load(self) -> Tuple[Table, Table]:
+        """
+        Return tables of steps and games of all chunks.
+        Only the latest ingest of every replay is used.
+        Column `game` of steps is the row of the game in games table
+        """
+        steps = {name: array(typecode) for name, typecode in STEP_COLUMNS.items()}
+        games = {name: array(typecode) for name, typecode in GAME_COLUMNS.items()}
+        games.update({name: [] for name in GAME_TEXT_COLUMNS})
+
+        texts = []
+        for chunk in self.manifest['chunks']:
+            with open(os.path.join(self.path, chunk, 'games.json')) as file:
+                texts.append(json.load(file))
+        # later chunks overwrite rows of replays that were ingested again
+        latest = {path: (number, row) for number, text in enumerate(texts) for row, path in enumerate(text['path'])}
+
+        for number, (chunk, text) in enumerate(zip(self.manifest['chunks'], texts)):
+            directory = os.path.join(self.path, chunk)
+            keep = [latest[path] == (number, row) for row, path in enumerate(text['path'])]
+            # new row of every kept game in games table
+            rows, offset = [], len(games['steps'])
+            for kept in keep:
+                rows.append(offset)
+                offset += kept
+
+            chunkSteps = Table(_load_columns(directory, 'steps', STEP_COLUMNS))
+            chunkSteps = chunkSteps.select([keep[game] for game in chunkSteps['game']])
+            chunkSteps['game'][:] = array('i', (rows[game] for game in chunkSteps['game']))
+            for name, column in chunkSteps.columns.items():
+                steps[name].extend(column)
+
+            chunkGames = Table({**_load_columns(directory, 'games', GAME_COLUMNS), **text}).select(keep)
+            for name, column in chunkGames.columns.items():
+                games[name].extend(column)
+
+        return Table(steps), Table(games)
+
+
+def _sides(games: Table):
+    """
+    Yield (bot, reason, death x, death y, steps) for both snakes of every game
+    """
+    for number in (1, 2):
+        yield from zip(games[f'bot{number}'], games[f'reason{number}'],
+                       games[f'death{number}x'], games[f'death{number}y'], games['steps'])
+
+
+def death_reasons(games: Table) -> Dict[str, Counter]:
+    """
+    Return counts of death reasons of every bot
+    """
+    result = {}
+    for bot, reason, *_ in _sides(games):
+        result.setdefault(bot, Counter())[REASONS[reason]] += 1
+    return result
+
+
+def survival_curves(games: Table, maxIteration: int = constants.MAX_GAME_ITERATIONS) -> Dict[str, List[float]]:
+    """
+    Return probability that every bot is still alive after each iteration (Kaplan-Meier).
+    A bot that outlived its opponent is observed only until the end of the game,
+    so the game is censored there instead of counting the bot alive until `maxIteration`
+    """
+    deaths = {}
+    censored = {}
+    totals = Counter()
+    alive = REASONS.index('alive')
+    for bot, reason, _, _, steps in _sides(games):
+        totals[bot] += 1
+        counts = (censored if reason == alive else deaths).setdefault(bot, [0] * (maxIteration + 2))
+        counts[min(steps, maxIteration + 1)] += 1
+
+    curves = {}
+    for bot, total in totals.items():
+        botDeaths = deaths.get(bot, [0] * (maxIteration + 2))
+        botCensored = censored.get(bot, [0] * (maxIteration + 2))
+        curve, survival, atRisk = [], 1.0, total
+        for dead, lost in zip(botDeaths, botCensored):
+            if atRisk:
+                survival *= 1 - dead / atRisk
+            curve.append(survival)
+            atRisk -= dead + lost
+        curves[bot] = curve
+    return curves
+
+
+def first_apple_times(steps: Table, games: Table) -> Dict[str, List[int]]:
+    """
+    Return iterations at which every bot ate its first apple (games without apples are skipped)
+    """
+    result = {}
+    eaten = set()
+    for game, iteration, score1, score2 in zip(steps['game'], steps['iteration'], steps['score1'], steps['score2']):
+        for number, score in ((1, score1), (2, score2)):
+            if score and (game, number) not in eaten:
+                eaten.add((game, number))
+                result.setdefault(games[f'bot{number}'][game], []).append(iteration)
+    return result
+
+
+def death_heatmap(games: Table, reason: str = None) -> List[List[int]]:
+    """
+    Return number of deaths (with given reason) in every cell: heatmap[y][x]
+    """
+    width, height = constants.GAME_SIZE
+    heatmap = [[0] * width for _ in range(height)]
+    for _, snakeReason, x, y, _ in _sides(games):
+        if reason and REASONS[snakeReason] != reason:
+            continue
+        if 0 <= x < width and 0 <= y < height:
+            heatmap[y][x] += 1
+    # snakes died in head-on collision share the cell, count it once
+    if reason == 'head_on':
+        heatmap = [[count // 2 for count in row] for row in heatmap]
+    return heatmap
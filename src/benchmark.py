@@ -0,0 +1,293 @@
+"""
+Benchmark of bot decision latency over a corpus of positions
+extracted from recorded games
+"""
+import json
+import logging
+import multiprocessing
+import multiprocessing.connection
+import os
+import resource
+import time
+from collections import deque
+from typing import Dict, List
+
+from . import snapshot as snapshots
+from .geometry import Coordinate, directions
+from .importsTools import import_bot
+from .snake import Snake
+from .utils import find_all_files_with_pattern
+
+
+def load_positions(paths: List[str], last: int = None) -> List[dict]:
+    """
+    Extract positions from recorded games (json output of `playGame.py`).
+    Every recorded iteration gives two positions: one for each snake.
+    If `last` is given, only last `last` iterations of every game are taken
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(find_all_files_with_pattern(path, r'\.json$', recursive=True))
+        else:
+            files.append(path)
+
+    positions = []
+    for path in files:
+        with open(path) as file:
+            states = json.load(file)
+
+        iterations = sorted(int(key) for key in states if key != 'metadata')
+        if last:
+            iterations = iterations[-last:]
+
+        for iterationNumber in iterations:
+            snapshot = snapshots.from_replay(states, iterationNumber)
+            # SnakeRunner can not pass missing apple to the bot
+            if not snapshot['apple']:
+                continue
+            for snake, opponent in (('snake1', 'snake2'), ('snake2', 'snake1')):
+                positions.append({
+                    'source': f"{path}:{iterationNumber}:{snake}",
+                    'mazeSize': snapshot['mazeSize'],
+                    'snake': snapshot[snake],
+                    'opponent': snapshot[opponent],
+                    'apple': snapshot['apple'],
+                })
+
+    logging.debug(f"Loaded {len(positions)} positions from {len(files)} games")
+    return positions
+
+
+def _make_snake(mazeSize: Coordinate, values: List[int]) -> Snake:
+    body = [Coordinate(x, y) for x, y in zip(values[::2], values[1::2])]
+    return Snake(mazeSize, elements=set(body), body=body)
+
+
+def _run_position(bot, position: dict) -> tuple:
+    """
+    Call bot on the position with the same fresh copies
+    of objects that `SnakeRunner.run` passes to the bot.
+    Return (latency, direction, error)
+    """
+    mazeSize = Coordinate(*position['mazeSize'])
+    data = (
+        _make_snake(mazeSize, position['snake']),
+        _make_snake(mazeSize, position['opponent']),
+        mazeSize.clone(), Coordinate(*position['apple']),
+    )
+    error = None
+    direction = None
+    startTime = time.perf_counter()
+    try:
+        result = bot.chooseDirection(*data)
+    except Exception as e:
+        error = e.__str__() or type(e).__name__
+    latency = time.perf_counter() - startTime
+
+    if not error:
+        if result in directions:
+            direction = str(result)
+        else:
+            error = f"Invalid direction: {result}"
+    return latency, direction, error
+
+
+def _worker(botPath: str, connection):
+    """
+    Import the bot and run positions received from the connection until None.
+    Memory growth is measured from the moment the bot is created
+    """
+    try:
+        bot = import_bot(botPath)
+    except Exception as e:
+        connection.send({'error': f"Bot can not be created: {e.__str__() or type(e).__name__}"})
+        return
+
+    startMemory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    connection.send({'ready': True})
+    while True:
+        position = connection.recv()
+        if position is None:
+            break
+        result = _run_position(bot, position)
+        memoryGrowth = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - startMemory
+        connection.send({'result': result, 'memoryGrowthKb': memoryGrowth})
+
+
+class _Worker:
+    """
+    Process with its own instance of the bot, that runs one position at a time
+    """
+
+    def __init__(self, botPath: str, startTimeout: float):
+        self.connection, workerConnection = multiprocessing.Pipe()
+        # not daemonic, so bots can start their own processes (e.g. `src.mcts.MCTS`)
+        self.process = multiprocessing.Process(target=_worker, args=(botPath, workerConnection))
+        self.process.start()
+        workerConnection.close()
+
+        self.ready = False
+        self.index = None  # position that is running
+        self.deadline = time.time() + startTimeout
+        self.memoryGrowthKb = None
+
+    def run(self, index: int, position: dict, timeout: float):
+        self.connection.send(position)
+        self.index = index
+        self.deadline = time.time() + timeout
+
+    def stop(self, kill: bool = False):
+        if not kill:
+            try:
+                self.connection.send(None)
+            except OSError:
+                pass
+            self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.connection.close()
+
+
+def run_bot(botPath: str, positions: List[dict], processes: int = None,
+            requestTimeout: float = 2, startTimeout: float = 30) -> dict:
+    """
+    Run bot on all positions in several processes, that contain only this bot.
+    Every process imports its own instance of the bot and gets one position at a time.
+
+    If a position takes more than `requestTimeout` seconds, the bot is considered hung
+    on it: the process is killed, the position is reported as hung
+    and the rest of positions go to a new process
+    """
+    latencies = [None] * len(positions)
+    moves = [None] * len(positions)
+    errors = {}
+    # growth of every worker from creation of its bot to its last position
+    memoryGrowth = []
+    hung = 0
+    pending = deque(range(len(positions)))
+    failure = None  # bot can not be created
+
+    workers = []
+
+    def retire(worker: _Worker, kill: bool = False):
+        worker.stop(kill)
+        workers.remove(worker)
+        if worker.memoryGrowthKb is not None:
+            memoryGrowth.append(worker.memoryGrowthKb)
+        if pending and not failure:
+            workers.append(_Worker(botPath, startTimeout))
+
+    for _ in range(min(processes or os.cpu_count(), len(positions))):
+        workers.append(_Worker(botPath, startTimeout))
+
+    try:
+        while workers:
+            for worker in list(workers):
+                if worker.ready and worker.index is None:
+                    if pending and not failure:
+                        index = pending.popleft()
+                        worker.run(index, positions[index], requestTimeout)
+                    else:
+                        retire(worker)
+            if not workers:
+                break
+
+            deadlines = [worker.deadline for worker in workers if worker.deadline]
+            timeout = max(min(deadlines) - time.time(), 0) if deadlines else None
+            connections = {worker.connection: worker for worker in workers}
+            for connection in multiprocessing.connection.wait(list(connections), timeout=timeout):
+                worker = connections[connection]
+                try:
+                    message = connection.recv()
+                except EOFError:
+                    if worker.index is not None:
+                        errors[positions[worker.index]['source']] = \
+                            f"Worker died with exit code {worker.process.exitcode}"
+                        worker.index = None
+                    retire(worker)
+                    continue
+
+                if 'error' in message:
+                    failure = message['error']
+                    retire(worker)
+                elif 'ready' in message:
+                    worker.ready = True
+                    worker.deadline = None
+                else:
+                    latency, direction, error = message['result']
+                    latencies[worker.index] = latency
+                    moves[worker.index] = direction
+                    if error:
+                        errors[positions[worker.index]['source']] = error
+                    worker.memoryGrowthKb = message['memoryGrowthKb']
+                    worker.index = None
+                    worker.deadline = None
+
+            now = time.time()
+            for worker in list(workers):
+                if worker.deadline and worker.deadline < now:
+                    if worker.index is None:
+                        failure = f"Bot can not be created in {startTimeout} seconds"
+                    else:
+                        hung += 1
+                        logging.warning(f"Bot {botPath} hung on {positions[worker.index]['source']}")
+                    retire(worker, kill=True)
+    finally:
+        for worker in list(workers):
+            worker.stop(kill=True)
+
+    if failure:
+        errors.update((positions[index]['source'], failure) for index in pending)
+
+    return {
+        'bot': botPath,
+        'latencies': latencies,
+        'moves': moves,
+        'errors': errors,
+        'hung': hung,
+        'memoryGrowthKb': max(memoryGrowth, default=0),
+    }
+
+
+def percentile(values: List[float], p: float) -> float:
+    """
+    Return p-th percentile (0..100) of values using nearest-rank method
+    """
+    values = sorted(values)
+    if not values:
+        return float('nan')
+    rank = max(int(-(-p * len(values) // 100)), 1)
+    return values[rank - 1]
+
+
+def summarize(run: dict, timeout: float = 1, reference: dict = None) -> Dict:
+    """
+    Return latency percentiles, number of timeouts and errors,
+    memory growth and agreement with moves of the reference bot
+    """
+    latencies = [latency for latency in run['latencies'] if latency is not None]
+    summary = {
+        'bot': run['bot'],
+        'positions': len(run['latencies']),
+        'p50': percentile(latencies, 50),
+        'p90': percentile(latencies, 90),
+        'p99': percentile(latencies, 99),
+        'max': max(latencies, default=float('nan')),
+        'timeouts': sum(latency > timeout for latency in latencies) + run['hung'],
+        'hung': run['hung'],
+        'errors': len(run['errors']),
+        'memoryGrowthKb': run['memoryGrowthKb'],
+    }
+
+    if reference:
+        compared = [
+            (move, referenceMove)
+            for move, referenceMove in zip(run['moves'], reference['moves'])
+            if referenceMove is not None
+        ]
+        agreed = sum(move == referenceMove for move, referenceMove in compared)
+        summary['agreement'] = agreed / len(compared) if compared else float('nan')
+
+    return summary
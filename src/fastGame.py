@@ -0,0 +1,152 @@
+"""
+Compact game state for search (opening book, MCTS, tablebase).
+
+Cells are integers `y * width + x`, bodies are tuples of cells (head first),
+moves are indexes in `src.geometry.directions`.
+`step` follows the rules of `Game.run_one_step`, except that an eaten apple
+is not respawned (new apple is random, so search does not know it)
+"""
+from typing import List, NamedTuple, Tuple, Union
+
+from . import constants
+from .geometry import Coordinate, Direction, directions
+
+NO_APPLE = -1
+OUT_OF_BOUNDS = -1
+
+DRAW = 0
+SNAKE1_WON = 1
+SNAKE2_WON = 2
+
+MOVES = range(len(directions))
+DELTAS = [(d.dx, d.dy) for d in directions]
+
+
+class State(NamedTuple):
+    width: int
+    height: int
+    body1: Tuple[int, ...]
+    body2: Tuple[int, ...]
+    apple: int = NO_APPLE
+    iteration: int = 0
+
+
+def to_cell(coordinate: Coordinate, width: int) -> int:
+    return coordinate.y * width + coordinate.x
+
+
+def to_coordinate(cell: int, width: int) -> Coordinate:
+    return Coordinate(cell % width, cell // width)
+
+
+def to_direction(move: int) -> Direction:
+    return directions[move]
+
+
+def to_move(direction: Direction) -> int:
+    return directions.index(direction)
+
+
+def from_snakes(snake, opponent, mazeSize: Coordinate, apple: Coordinate = None, iteration=0) -> State:
+    """
+    Make state from arguments of `IBot.chooseDirection`.
+    `snake` becomes the first snake of the state
+    """
+    width = mazeSize.x
+    return State(
+        width, mazeSize.y,
+        tuple(to_cell(c, width) for c in snake.body),
+        tuple(to_cell(c, width) for c in opponent.body),
+        to_cell(apple, width) if apple else NO_APPLE,
+        iteration,
+    )
+
+
+def from_game(game) -> State:
+    """
+    Make state from `src.game.Game`
+    """
+    return from_snakes(game.snake1, game.snake2, game.mazeSize,
+                       game.appleCoordinate, game.iterationNumber)
+
+
+def swap(state: State) -> State:
+    """
+    Return the same state from the point of view of the second snake
+    """
+    return state._replace(body1=state.body2, body2=state.body1)
+
+
+def move_head(state: State, head: int, move: int) -> int:
+    """
+    Return new cell of the head or OUT_OF_BOUNDS
+    """
+    dx, dy = DELTAS[move]
+    x = head % state.width + dx
+    y = head // state.width + dy
+    if 0 <= x < state.width and 0 <= y < state.height:
+        return y * state.width + x
+    return OUT_OF_BOUNDS
+
+
+def compare_lengths(state: State) -> int:
+    """
+    Result of the game if both snakes are dead:
+    the longer snake (which ate more apples) wins
+    """
+    if len(state.body1) > len(state.body2):
+        return SNAKE1_WON
+    if len(state.body2) > len(state.body1):
+        return SNAKE2_WON
+    return DRAW
+
+
+def step(state: State, move1: int, move2: int) -> Tuple[State, Union[int, None]]:
+    """
+    Make one game iteration.
+    Return new state and result of the game (None if game continues)
+    """
+    if state.iteration > constants.MAX_GAME_ITERATIONS:
+        return state, compare_lengths(state)
+
+    head1 = move_head(state, state.body1[0], move1)
+    head2 = move_head(state, state.body2[0], move2)
+    grow1 = head1 != OUT_OF_BOUNDS and head1 == state.apple
+    grow2 = head2 != OUT_OF_BOUNDS and head2 == state.apple
+
+    rest1 = state.body1 if grow1 else state.body1[:-1]
+    rest2 = state.body2 if grow2 else state.body2[:-1]
+    dead1 = head1 == OUT_OF_BOUNDS or head1 in rest1
+    dead2 = head2 == OUT_OF_BOUNDS or head2 in rest2
+    # head collides with body or head of opponent
+    dead1 |= head1 == head2 or head1 in rest2
+    dead2 |= head2 == head1 or head2 in rest1
+
+    if dead1 or dead2:
+        if not dead2:
+            return state, SNAKE2_WON
+        if not dead1:
+            return state, SNAKE1_WON
+        return state, compare_lengths(state)
+
+    newState = State(
+        state.width, state.height, (head1,) + rest1, (head2,) + rest2,
+        NO_APPLE if grow1 or grow2 else state.apple, state.iteration + 1,
+    )
+    return newState, None
+
+
+def safe_moves(state: State, body: Tuple[int, ...]) -> List[int]:
+    """
+    Return moves that do not kill the snake immediately
+    (without considering the opponent).
+    Moving into the current tail cell is safe, because the tail moves away.
+    If there are no such moves, return all moves
+    """
+    obstacles = set(state.body1[:-1]) | set(state.body2[:-1])
+    result = [
+        move for move in MOVES
+        if move_head(state, body[0], move) not in obstacles
+        and move_head(state, body[0], move) != OUT_OF_BOUNDS
+    ]
+    return result or list(MOVES)
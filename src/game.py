@@ -1,14 +1,25 @@
 import random
+from array import array
+from base64 import b64decode, b64encode
 from itertools import chain
-from typing import Tuple, Union
+from typing import List, Tuple, Union
 import logging
 
 from . import constants
+from . import snapshot as snapshots
 from .bot import IBot
 from .geometry import DOWN, LEFT, RIGHT, UP, Coordinate, Direction
 from .snake import Snake, SnakeRunner
 
 
+def _pack_coordinates(coordinates) -> List[int]:
+    return [value for c in coordinates for value in (c.x, c.y)]
+
+
+def _unpack_coordinates(values: List[int]) -> List[Coordinate]:
+    return [Coordinate(x, y) for x, y in zip(values[::2], values[1::2])]
+
+
 class GameOver(Exception):
     """
     Exception for stopping the game
@@ -36,9 +47,13 @@ class Game:
             head2: Coordinate, tailDir2: Coordinate,
             size: int, mazeSize: Coordinate = None,
             bots: Tuple[IBot, IBot] = None,
-            executors: Tuple[SnakeRunner, SnakeRunner] = None):
+            executors: Tuple[SnakeRunner, SnakeRunner] = None,
+            rng: random.Random = None):
 
-        self.gameId = random.randint(2**31, 2**32)
+        # own generator of apples, which bots can not affect.
+        # it is seeded from module `random`, so `random.seed` still reproduces games
+        self.random = rng or random.Random(random.getrandbits(64))
+        self.gameId = self.random.randint(2**31, 2**32)
 
         self.mazeSize = mazeSize
         self.snake1 = Snake(self.mazeSize, initialHead=head1,
@@ -92,6 +107,53 @@ class Game:
                     snakeSize, mazeSize, bots=bots, executors=executors)
         return game
 
+    @staticmethod
+    def from_snapshot(snapshot: dict, bots=None, executors=None, rng=None, restoreRandom=True):
+        """
+        Restore game from snapshot made by `get_snapshot`
+
+        Internal state of the bots is not a part of the snapshot,
+        so bots start from their freshly created state.
+        If `restoreRandom` is true and snapshot contains RNG state,
+        then apple generator of the game continues from it
+        """
+        mazeSize = Coordinate(*snapshot['mazeSize'])
+        body1 = _unpack_coordinates(snapshot['snake1'])
+        body2 = _unpack_coordinates(snapshot['snake2'])
+
+        game = Game(body1[0], None, body2[0], None, 1, mazeSize,
+                    bots=bots, executors=executors, rng=rng)
+
+        # runners hold references to the snakes, so change them in place
+        game.snake1.body, game.snake1.elements = body1, set(body1)
+        game.snake2.body, game.snake2.elements = body2, set(body2)
+
+        game.iterationNumber = snapshot['iteration']
+        game.score1 = snapshot['score1']
+        game.score2 = snapshot['score2']
+        game.gameId = snapshot.get('gameId', game.gameId)
+        apple = snapshot['apple']
+        game.appleCoordinate = Coordinate(*apple) if apple else None
+
+        if restoreRandom and snapshot.get('random'):
+            version, internalState, gauss = snapshot['random']
+            game.random.setstate(
+                (version, tuple(array('I', b64decode(internalState))), gauss))
+
+        return game
+
+    @staticmethod
+    def from_replay(states: dict, iterationNumber: int = 0, bots=None, executors=None, rng=None):
+        """
+        Restore game at given iteration of recorded game (output of `GameIter.getStates`)
+
+        Negative `iterationNumber` counts from the last recorded iteration,
+        e.g. -50 restores position 50 moves before the end of the game.
+        Replays do not contain RNG state, so next apples will differ from recorded ones
+        """
+        snapshot = snapshots.from_replay(states, iterationNumber)
+        return Game.from_snapshot(snapshot, bots=bots, executors=executors, rng=rng)
+
     @property
     def randomNonOccupiedCell(self) -> Union[Coordinate, None]:
         """
@@ -99,8 +161,8 @@ class Game:
         If there are none, return None
         """
         randomCell = Coordinate(
-            random.randint(0, self.mazeSize.x - 1),
-            random.randint(0, self.mazeSize.y - 1),
+            self.random.randint(0, self.mazeSize.x - 1),
+            self.random.randint(0, self.mazeSize.y - 1),
         )
         # TODO: fix method. it can go out of mazeSize
         for dy in range(self.mazeSize.y):
@@ -278,6 +340,28 @@ class Game:
 
         return info
 
+    def get_snapshot(self, withRandom=True) -> dict:
+        """
+        Return compact JSON-serializable snapshot of full game state.
+        Game can be restored from it with `Game.from_snapshot`
+        """
+        snapshot = {
+            'mazeSize': [self.mazeSize.x, self.mazeSize.y],
+            'iteration': self.iterationNumber,
+            'snake1': _pack_coordinates(self.snake1.body),
+            'snake2': _pack_coordinates(self.snake2.body),
+            'apple': [self.appleCoordinate.x, self.appleCoordinate.y] if self.appleCoordinate else None,
+            'score1': self.score1,
+            'score2': self.score2,
+            'gameId': self.gameId,
+        }
+        if withRandom:
+            version, internalState, gauss = self.random.getstate()
+            snapshot['random'] = [
+                version, b64encode(array('I', internalState).tobytes()).decode(), gauss]
+
+        return snapshot
+
     def __iter__(self):
         return GameIter(self)
 
@@ -314,6 +398,8 @@ class GameIter:
             metadata['score'] = self.game.score1, self.game.score2
             metadata['gameId'] = self.game.gameId
             metadata['result'] = self.game.result
+            # position after the last moves (e.g. where the snakes collided)
+            metadata['finalState'] = self.game.get_state()
 
             team1 = metadata['team1']
             team2 = metadata['team2']
@@ -0,0 +1,275 @@
+"""
+Monte Carlo tree search for bots.
+
+Snakes move simultaneously, so every node keeps separate UCB statistics
+for the moves of each snake (decoupled UCT).
+Several independent trees are searched in worker processes (root parallelization),
+their statistics of the root moves are summed.
+Workers are started once and keep their trees between turns:
+if the new position is a child of the previous root, its subtree is reused.
+Workers are stopped by `close()` or when the object is garbage collected.
+Daemonic processes (e.g. of `multiprocessing.Pool`) can not have children,
+so there the search runs in the calling process
+
+    class Bot(IBot):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.mcts = MCTS()
+
+        def chooseDirection(self, snake, opponent, mazeSize, apple):
+            return self.mcts.chooseDirection(snake, opponent, mazeSize, apple)
+"""
+import math
+import multiprocessing
+import multiprocessing.connection
+import os
+import random
+import time
+import weakref
+from typing import Dict, List, Tuple, Union
+
+from . import fastGame
+from .fastGame import State
+from .geometry import Coordinate, Direction
+
+# reward of the first snake for every result
+REWARDS = {fastGame.SNAKE1_WON: 1.0, fastGame.SNAKE2_WON: 0.0, fastGame.DRAW: 0.5}
+
+
+class Node:
+    __slots__ = ('state', 'visits', 'moves1', 'moves2', 'stats1', 'stats2', 'children')
+
+    def __init__(self, state: State):
+        self.state = state
+        self.visits = 0
+        self.moves1 = fastGame.safe_moves(state, state.body1)
+        self.moves2 = fastGame.safe_moves(state, state.body2)
+        # [visits, total reward] of every move
+        self.stats1 = [[0, 0.0] for _ in self.moves1]
+        self.stats2 = [[0, 0.0] for _ in self.moves2]
+        # (move1 index, move2 index) -> Node or result of the game
+        self.children: Dict[Tuple[int, int], Union['Node', int]] = {}
+
+    def select(self, stats: List[List[float]], exploration: float, rng: random.Random) -> int:
+        """
+        Return index of move with maximal UCB1 value. Not visited moves go first
+        """
+        notVisited = [i for i, (visits, _) in enumerate(stats) if not visits]
+        if notVisited:
+            return rng.choice(notVisited)
+
+        logVisits = math.log(self.visits)
+        return max(
+            range(len(stats)),
+            key=lambda i: stats[i][1] / stats[i][0] + exploration * math.sqrt(logVisits / stats[i][0]),
+        )
+
+
+def _same_position(a: State, b: State) -> bool:
+    return a.body1 == b.body1 and a.body2 == b.body2 and a.apple == b.apple
+
+
+def evaluate(state: State) -> float:
+    """
+    Reward of the first snake in not finished game (0..1)
+    """
+    difference = len(state.body1) - len(state.body2)
+    return 0.5 + 0.5 * difference / (abs(difference) + 2)
+
+
+def rollout(state: State, depth: int, rng: random.Random) -> float:
+    """
+    Play random safe moves and return reward of the first snake
+    """
+    for _ in range(depth):
+        move1 = rng.choice(fastGame.safe_moves(state, state.body1))
+        move2 = rng.choice(fastGame.safe_moves(state, state.body2))
+        state, result = fastGame.step(state, move1, move2)
+        if result is not None:
+            return REWARDS[result]
+    return evaluate(state)
+
+
+def iterate(root: Node, exploration: float, rolloutDepth: int, rng: random.Random):
+    """
+    One iteration of search: selection, expansion, rollout and backpropagation
+    """
+    path = []
+    node = root
+    while True:
+        i = node.select(node.stats1, exploration, rng)
+        j = node.select(node.stats2, exploration, rng)
+        path.append((node, i, j))
+
+        child = node.children.get((i, j))
+        if child is None:
+            newState, result = fastGame.step(node.state, node.moves1[i], node.moves2[j])
+            if result is not None:
+                node.children[(i, j)] = result
+                reward = REWARDS[result]
+            else:
+                node.children[(i, j)] = Node(newState)
+                reward = rollout(newState, rolloutDepth, rng)
+            break
+        if not isinstance(child, Node):
+            reward = REWARDS[child]
+            break
+        node = child
+
+    for node, i, j in path:
+        node.visits += 1
+        node.stats1[i][0] += 1
+        node.stats1[i][1] += reward
+        node.stats2[j][0] += 1
+        node.stats2[j][1] += 1 - reward
+
+
+def reuse_tree(root: Union[Node, None], state: State) -> Node:
+    """
+    Return subtree of the previous root for given state or a new tree
+    """
+    if root:
+        if _same_position(root.state, state):
+            return root
+        for child in root.children.values():
+            if isinstance(child, Node) and _same_position(child.state, state):
+                return child
+    return Node(state)
+
+
+def _worker(connection, seed: int, exploration: float, rolloutDepth: int):
+    """
+    Search until deadline of every request and send statistics of root moves
+    """
+    rng = random.Random(seed)
+    root = None
+    while True:
+        request = connection.recv()
+        if request is None:
+            break
+        turn, state, deadline = request
+
+        root = reuse_tree(root, state)
+        while time.time() < deadline:
+            iterate(root, exploration, rolloutDepth, rng)
+
+        statistics = {root.moves1[i]: tuple(stats) for i, stats in enumerate(root.stats1)}
+        connection.send((turn, statistics))
+
+
+def _stop_workers(connections, processes):
+    for connection in connections:
+        try:
+            connection.send(None)
+        except OSError:
+            pass
+    for process in processes:
+        # worker may be searching until the deadline of the last request
+        process.join(timeout=1)
+        if process.is_alive():
+            process.kill()
+            process.join()
+    for connection in connections:
+        connection.close()
+
+
+class MCTS:
+    """
+    Root-parallel search with warm worker processes.
+
+    timeout       -- time limit of one decision (as in the checker)
+    safetyMargin  -- seconds reserved for overhead of the bot and the checker
+    """
+
+    def __init__(self, processes: int = None, timeout: float = 1, safetyMargin: float = 0.15,
+                 exploration: float = 1.4, rolloutDepth: int = 20, seed: int = None):
+        self.timeout = timeout
+        self.safetyMargin = safetyMargin
+        self.turn = 0
+        self.exploration = exploration
+        self.rolloutDepth = rolloutDepth
+
+        rng = random.Random(seed)
+        # state of the search in this process, when there are no workers
+        self._rng = random.Random(rng.randrange(2**32))
+        self._root = None
+
+        self._connections = []
+        self._processes = []
+        if multiprocessing.current_process().daemon:
+            processes = 0
+        else:
+            processes = processes or os.cpu_count()
+        for _ in range(processes):
+            connection, workerConnection = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=_worker, daemon=True,
+                args=(workerConnection, rng.randrange(2**32), exploration, rolloutDepth))
+            process.start()
+            self._connections.append(connection)
+            self._processes.append(process)
+        # does not reference self, so the object can be collected
+        self._finalizer = weakref.finalize(self, _stop_workers, self._connections, self._processes)
+
+    def search(self, state: State, deadline: float) -> Dict[int, Tuple[int, float]]:
+        """
+        Return summed (visits, total reward) of every move of the first snake.
+        Workers that did not answer before deadline are ignored
+        """
+        self.turn += 1
+        if not self._connections:
+            self._root = reuse_tree(self._root, state)
+            while time.time() < deadline:
+                iterate(self._root, self.exploration, self.rolloutDepth, self._rng)
+            return {self._root.moves1[i]: tuple(stats) for i, stats in enumerate(self._root.stats1)}
+
+        # workers stop a bit earlier to have time to send the results
+        workerDeadline = deadline - 0.02
+        for connection in self._connections:
+            connection.send((self.turn, state, workerDeadline))
+
+        statistics = {}
+        waiting = list(self._connections)
+        while waiting:
+            remaining = deadline - time.time()
+            ready = multiprocessing.connection.wait(waiting, timeout=max(remaining, 0))
+            if not ready:
+                break
+            for connection in ready:
+                turn, workerStatistics = connection.recv()
+                # late answer for one of the previous turns
+                if turn != self.turn:
+                    continue
+                waiting.remove(connection)
+                for move, (visits, reward) in workerStatistics.items():
+                    totalVisits, totalReward = statistics.get(move, (0, 0.0))
+                    statistics[move] = (totalVisits + visits, totalReward + reward)
+
+        return statistics
+
+    def chooseDirection(self, snake, opponent, mazeSize: Coordinate, apple: Coordinate) -> Direction:
+        """
+        Return the most visited move of the snake
+        (arguments are the same as in `IBot.chooseDirection`)
+        """
+        deadline = time.time() + self.timeout - self.safetyMargin
+        state = fastGame.from_snakes(snake, opponent, mazeSize, apple)
+        statistics = self.search(state, deadline)
+
+        if not statistics:
+            return fastGame.to_direction(fastGame.safe_moves(state, state.body1)[0])
+        move = max(statistics, key=lambda m: statistics[m][0])
+        return fastGame.to_direction(move)
+
+    def close(self):
+        """
+        Stop worker processes
+        """
+        self._finalizer()
+        self._connections, self._processes = [], []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
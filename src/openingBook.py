@@ -0,0 +1,280 @@
+"""
+Opening book: best moves for positions of the first game iterations.
+
+Book is a sorted binary file of fixed-size records (canonical state hash, move).
+`OpeningBook` memory-maps the file and finds a record with binary search,
+so the book is never loaded into Python objects.
+
+Positions equal up to rotation or reflection of the maze share one record:
+the hash and the move are stored for the transformation of the position
+with the minimal hash (canonical form)
+"""
+import hashlib
+import logging
+import mmap
+import multiprocessing
+import struct
+from array import array
+from typing import Dict, List, Tuple, Union
+
+from . import constants
+from . import fastGame
+from .fastGame import State
+from .geometry import Coordinate, Direction
+
+MAGIC = b'SNOB'
+VERSION = 1
+HEADER = struct.Struct('<4sHHHI')  # magic, version, width, height, number of records
+RECORD = struct.Struct('<QB')  # canonical state hash, move
+
+WIN_SCORE = 10**6
+
+
+def _transforms(width: int, height: int) -> List:
+    """
+    Return symmetries of the maze as functions of (x, y)
+    """
+    transforms = [
+        lambda x, y: (x, y),
+        lambda x, y: (width - 1 - x, y),
+        lambda x, y: (x, height - 1 - y),
+        lambda x, y: (width - 1 - x, height - 1 - y),
+    ]
+    if width == height:
+        transforms += [
+            lambda x, y: (y, x),
+            lambda x, y: (width - 1 - y, x),
+            lambda x, y: (y, width - 1 - x),
+            lambda x, y: (width - 1 - y, width - 1 - x),
+        ]
+    return transforms
+
+
+def _move_permutation(transform) -> List[int]:
+    """
+    Return new index of every move after transformation
+    """
+    x0, y0 = transform(0, 0)
+    permutation = []
+    for dx, dy in fastGame.DELTAS:
+        x, y = transform(dx, dy)
+        permutation.append(fastGame.DELTAS.index((x - x0, y - y0)))
+    return permutation
+
+
+def _hash(state: State, transform) -> int:
+    def cells(body):
+        return [value for cell in body for value in transform(cell % state.width, cell // state.width)]
+
+    apple = cells([state.apple]) if state.apple != fastGame.NO_APPLE else [-1, -1]
+    values = array('h', [state.width, state.height, len(state.body1)] + cells(state.body1)
+                   + [len(state.body2)] + cells(state.body2) + apple)
+    return int.from_bytes(hashlib.blake2b(values.tobytes(), digest_size=8).digest(), 'little')
+
+
+def canonical_hash(state: State) -> Tuple[int, List[int]]:
+    """
+    Return canonical hash of the state (from the point of view of its first snake)
+    and permutation of moves from the real maze to the canonical one
+    """
+    return min(
+        (_hash(state, transform), _move_permutation(transform))
+        for transform in _transforms(state.width, state.height)
+    )
+
+
+def evaluate(state: State) -> int:
+    """
+    Heuristic score of the state for the first snake
+    """
+    score = (len(state.body1) - len(state.body2)) * 1000
+    score += (len(fastGame.safe_moves(state, state.body1))
+              - len(fastGame.safe_moves(state, state.body2))) * 10
+    if state.apple != fastGame.NO_APPLE:
+        def distance(head):
+            return (abs(head % state.width - state.apple % state.width)
+                    + abs(head // state.width - state.apple // state.width))
+        score += distance(state.body2[0]) - distance(state.body1[0])
+    return score
+
+
+def _result_score(result: int) -> int:
+    if result == fastGame.SNAKE1_WON:
+        return WIN_SCORE
+    if result == fastGame.SNAKE2_WON:
+        return -WIN_SCORE
+    return 0
+
+
+def search(state: State, depth: int) -> Tuple[int, int]:
+    """
+    Depth-limited search for the first snake,
+    assuming that the opponent answers with its best reply to every move.
+    Return best move and its score
+    """
+    bestMove, bestScore = None, None
+    for move1 in fastGame.safe_moves(state, state.body1):
+        worstScore = None
+        for move2 in fastGame.safe_moves(state, state.body2):
+            newState, result = fastGame.step(state, move1, move2)
+            if result is not None:
+                score = _result_score(result)
+            elif depth <= 1:
+                score = evaluate(newState)
+            else:
+                score = search(newState, depth - 1)[1]
+
+            if worstScore is None or score < worstScore:
+                worstScore = score
+            # this move is already not better than the best one
+            if bestScore is not None and worstScore <= bestScore:
+                break
+
+        if bestScore is None or worstScore > bestScore:
+            bestMove, bestScore = move1, worstScore
+
+    return bestMove, bestScore
+
+
+def initial_state(apple: int) -> State:
+    width, height = constants.GAME_SIZE
+
+    def body(head, direction):
+        x, y = head
+        dx, dy = direction
+        return tuple((y + dy * i) * width + x + dx * i for i in range(constants.SNAKES_INITIAL_SIZE))
+
+    return State(
+        width, height,
+        body(constants.SNAKE1_INITIAL_HEAD, constants.SNAKE1_INITIAL_DIRECTION),
+        body(constants.SNAKE2_INITIAL_HEAD, constants.SNAKE2_INITIAL_DIRECTION),
+        apple,
+    )
+
+
+def _add_entry(entries: Dict[int, int], state: State, depth: int):
+    key, permutation = canonical_hash(state)
+    if key not in entries:
+        move, _ = search(state, depth)
+        entries[key] = permutation[move]
+
+
+def build_for_apple(apple: int, plies: int, depth: int) -> Dict[int, int]:
+    """
+    Return book entries for all positions reachable from the initial position
+    with given apple in `plies` iterations, while nobody has eaten the apple
+    """
+    entries = {}
+    level = [initial_state(apple)]
+    for ply in range(plies + 1):
+        nextLevel = []
+        for state in level:
+            _add_entry(entries, state, depth)
+            _add_entry(entries, fastGame.swap(state), depth)
+            if ply == plies:
+                continue
+
+            for move1 in fastGame.safe_moves(state, state.body1):
+                for move2 in fastGame.safe_moves(state, state.body2):
+                    newState, result = fastGame.step(state, move1, move2)
+                    if result is None and newState.apple != fastGame.NO_APPLE:
+                        nextLevel.append(newState)
+        level = nextLevel
+
+    return entries
+
+
+def _build_for_apple(args) -> Dict[int, int]:
+    return build_for_apple(*args)
+
+
+def build(plies: int = 3, depth: int = 3, processes: int = None) -> Dict[int, int]:
+    """
+    Build opening book for every possible apple in the initial position
+    """
+    state = initial_state(fastGame.NO_APPLE)
+    occupied = set(state.body1) | set(state.body2)
+    apples = [cell for cell in range(state.width * state.height) if cell not in occupied]
+
+    entries = {}
+    with multiprocessing.Pool(processes) as pool:
+        tasks = [(apple, plies, depth) for apple in apples]
+        for number, appleEntries in enumerate(pool.imap_unordered(_build_for_apple, tasks)):
+            entries.update(appleEntries)
+            logging.info(f"Processed {number + 1}/{len(apples)} apples, {len(entries)} positions")
+
+    return entries
+
+
+def write(path: str, entries: Dict[int, int], width: int, height: int):
+    """
+    Write book entries to file sorted by hash
+    """
+    with open(path, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, VERSION, width, height, len(entries)))
+        for key in sorted(entries):
+            file.write(RECORD.pack(key, entries[key]))
+
+
+class OpeningBook:
+    """
+    Read-only opening book for bots
+
+    >>> book = OpeningBook('opening.book')
+    >>> direction = book.lookup(snake, opponent, mazeSize, apple)  # None if there is no such position
+    """
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.width, self.height, self.size = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            self._map.close()
+            raise ValueError(f"{path} is not an opening book of version {VERSION}")
+
+    def __len__(self):
+        return self.size
+
+    def _find(self, key: int) -> Union[int, None]:
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            middleKey, move = RECORD.unpack_from(self._map, HEADER.size + middle * RECORD.size)
+            if middleKey == key:
+                return move
+            if middleKey < key:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def lookup_state(self, state: State) -> Union[int, None]:
+        """
+        Return best move for the first snake of the state or None
+        """
+        if (state.width, state.height) != (self.width, self.height):
+            return None
+
+        key, permutation = canonical_hash(state)
+        move = self._find(key)
+        if move is None:
+            return None
+        return permutation.index(move)
+
+    def lookup(self, snake, opponent, mazeSize: Coordinate, apple: Coordinate) -> Union[Direction, None]:
+        """
+        Return best direction for the snake (arguments are the same as in `IBot.chooseDirection`)
+        or None if the position is not in the book
+        """
+        move = self.lookup_state(fastGame.from_snakes(snake, opponent, mazeSize, apple))
+        return fastGame.to_direction(move) if move is not None else None
+
+    def close(self):
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,85 @@
+"""
+Compact serialization of game snapshots (see `Game.get_snapshot`)
+for checkpointing and resuming games
+"""
+import json
+import os
+import zlib
+
+from . import constants
+
+
+def dumps(snapshot: dict) -> bytes:
+    """
+    Serialize snapshot to compressed bytes
+    """
+    return zlib.compress(json.dumps(snapshot, separators=(',', ':')).encode())
+
+
+def loads(data: bytes) -> dict:
+    """
+    Deserialize snapshot from bytes made by `dumps`
+    """
+    return json.loads(zlib.decompress(data).decode())
+
+
+def save(snapshot: dict, path: str):
+    """
+    Atomically write snapshot to file,
+    so interrupted job never leaves broken checkpoint
+    """
+    tmpPath = f"{path}.tmp"
+    with open(tmpPath, 'wb') as file:
+        file.write(dumps(snapshot))
+    os.replace(tmpPath, path)
+
+
+def load(path: str) -> dict:
+    """
+    Read snapshot from file written by `save`
+    """
+    with open(path, 'rb') as file:
+        return loads(file.read())
+
+
+def from_replay(states: dict, iterationNumber: int = 0) -> dict:
+    """
+    Make snapshot of given iteration of recorded game (output of `GameIter.getStates`)
+
+    Negative `iterationNumber` counts from the last recorded iteration,
+    e.g. -50 is the position 50 moves before the end of the game.
+    Replays do not contain RNG state, so next apples will differ from recorded ones
+    """
+    iterations = sorted(int(key) for key in states if key != 'metadata')
+    requested = iterationNumber
+    if iterationNumber < 0 and -iterationNumber <= len(iterations):
+        iterationNumber = iterations[iterationNumber]
+
+    try:
+        state = states[str(iterationNumber)]
+    except KeyError:
+        raise ValueError(
+            f"Iteration {requested} is not recorded. Available: {iterations[0]}..{iterations[-1]} "
+            f"or -{len(iterations)}..-1")
+
+    snapshot = {
+        'mazeSize': list(constants.GAME_SIZE),
+        'iteration': iterationNumber,
+        'snake1': _parse_coordinates(state['snake1']),
+        'snake2': _parse_coordinates(state['snake2']),
+        'apple': _parse_coordinates([state['apple']]) or None,
+        'score1': state['score1'],
+        'score2': state['score2'],
+    }
+    gameId = states.get('metadata', {}).get('gameId')
+    if gameId:
+        snapshot['gameId'] = gameId
+
+    return snapshot
+
+
+def _parse_coordinates(values) -> list:
+    """
+    Flatten coordinates from their string view ("x y") used in game states
+    """
+    return [int(v) for value in values if value not in (None, 'None') for v in value.split()]
@@ -0,0 +1,382 @@
+"""
+Endgame tablebase for small mazes.
+
+Table contains result of perfect play for every position of two snakes
+with given lengths when there is no apple on the maze
+(new apple appears randomly, so positions with apple are not solved).
+Snakes move simultaneously, so the table stores forced results:
+WIN if the first snake has a move that wins against every reply,
+LOSS if the second snake has such a move, DRAW otherwise.
+The limit of game iterations is not taken into account.
+
+Under the rules of `Game` there is always an apple on the maze, and eating it
+changes the length of the snake, so `Tablebase.probe` answers only when
+no head can reach the apple before the stored result (and before the end
+of the game for draws), and the result comes before the limit of iterations.
+Positions with apple and positions where snakes are confined to small regions
+of a large maze are not solved.
+
+File is a header and one byte for every position:
+    0                 draw (no forced result)
+    1..MAX_DISTANCE   first snake wins in given number of moves
+    128 + distance    first snake loses in given number of moves
+    255               invalid position
+Index of position is `shape1 * shapesCount(length2) + shape2`,
+where shape is head cell, direction to the second element
+and turns (straight, left, right) of the rest of the body.
+
+Table is solved by iterations: on iteration k positions with forced result
+in k moves are found. Every iteration is split between processes, which write
+to the memory-mapped file directly. Number of finished iterations is stored in
+the header, so interrupted generation continues from the last one
+"""
+import logging
+import mmap
+import multiprocessing
+import os
+import struct
+from typing import Dict, Tuple, Union
+
+from . import constants, fastGame
+from .fastGame import State
+from .geometry import Coordinate
+
+MAGIC = b'SNTB'
+VERSION = 1
+# magic, version, width, height, length1, length2, finished iterations, complete
+HEADER = struct.Struct('<4sHHHHHHB')
+
+DRAW_VALUE = 0
+LOSS_OFFSET = 128
+MAX_DISTANCE = 127
+INVALID = 255
+
+WIN = 'win'
+DRAW = 'draw'
+LOSS = 'loss'
+
+
+def shapes_count(width: int, height: int, length: int) -> int:
+    if length == 1:
+        return width * height
+    return width * height * 4 * 3 ** (length - 2)
+
+
+def _turn(delta: Tuple[int, int], turn: int) -> Tuple[int, int]:
+    dx, dy = delta
+    if turn == 1:  # left
+        return -dy, dx
+    if turn == 2:  # right
+        return dy, -dx
+    return dx, dy
+
+
+def decode_shape(index: int, width: int, height: int, length: int) -> Union[Tuple[int, ...], None]:
+    """
+    Return body of the snake for index of its shape
+    or None if the body goes out of maze or crosses itself
+    """
+    turns = []
+    for _ in range(length - 2):
+        index, turn = divmod(index, 3)
+        turns.append(turn)
+    if length > 1:
+        index, direction = divmod(index, 4)
+    head = index
+
+    body = [head]
+    x, y = head % width, head // width
+    if length > 1:
+        delta = fastGame.DELTAS[direction]
+        for turn in [0] + turns:
+            delta = _turn(delta, turn)
+            x, y = x + delta[0], y + delta[1]
+            if not (0 <= x < width and 0 <= y < height):
+                return None
+            body.append(y * width + x)
+
+    if len(set(body)) != length:
+        return None
+    return tuple(body)
+
+
+def encode_shape(body: Tuple[int, ...], width: int) -> int:
+    """
+    Return index of the shape of the body (inverse of `decode_shape`)
+    """
+    index = body[0]
+    if len(body) == 1:
+        return index
+
+    deltas = [
+        (b % width - a % width, b // width - a // width)
+        for a, b in zip(body, body[1:])
+    ]
+    index = index * 4 + fastGame.DELTAS.index(deltas[0])
+    turns = [[_turn(previous, turn) for turn in range(3)].index(delta)
+             for previous, delta in zip(deltas, deltas[1:])]
+    for turn in reversed(turns):
+        index = index * 3 + turn
+    return index
+
+
+class _Shapes:
+    """
+    Valid bodies of snakes of given length and their indexes
+    """
+
+    def __init__(self, width: int, height: int, length: int):
+        self.count = shapes_count(width, height, length)
+        self.bodies = [decode_shape(i, width, height, length) for i in range(self.count)]
+        self.indexes: Dict[Tuple[int, ...], int] = {
+            body: i for i, body in enumerate(self.bodies) if body}
+
+
+def _open_map(path: str, write: bool) -> mmap.mmap:
+    with open(path, 'r+b' if write else 'rb') as file:
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_WRITE if write else mmap.ACCESS_READ)
+
+
+def _read_header(table: mmap.mmap) -> tuple:
+    magic, version, *header = HEADER.unpack_from(table, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"File is not a tablebase of version {VERSION}")
+    return tuple(header)
+
+
+# values of moves that end the game
+_TERMINAL_WIN = -1
+_TERMINAL_LOSS = -2
+_TERMINAL_VALUES = {
+    fastGame.SNAKE1_WON: _TERMINAL_WIN, fastGame.SNAKE2_WON: _TERMINAL_LOSS, fastGame.DRAW: DRAW_VALUE}
+
+# data of the current worker process
+_worker = {}
+
+
+def _init_worker(path: str):
+    table = _open_map(path, write=True)
+    width, height, length1, length2, _, _ = _read_header(table)
+    _worker.update(
+        table=table, width=width, height=height,
+        shapes1=_Shapes(width, height, length1), shapes2=_Shapes(width, height, length2),
+    )
+
+
+def _mark_invalid(shapes1Range: Tuple[int, int]):
+    """
+    Mark invalid positions of given range of first snake shapes
+    """
+    table, shapes1, shapes2 = _worker['table'], _worker['shapes1'], _worker['shapes2']
+    invalidRow = bytes([INVALID]) * shapes2.count
+    for i1 in range(*shapes1Range):
+        offset = HEADER.size + i1 * shapes2.count
+        body1 = shapes1.bodies[i1]
+        if body1 is None:
+            table[offset:offset + shapes2.count] = invalidRow
+            continue
+        cells1 = set(body1)
+        for i2, body2 in enumerate(shapes2.bodies):
+            if body2 is None or not cells1.isdisjoint(body2):
+                table[offset + i2] = INVALID
+
+
+def _solve_iteration(args) -> int:
+    """
+    Find positions of given range of first snake shapes with forced result in `distance` moves.
+    Return number of found positions
+    """
+    (start, end), distance = args
+    table, width, height = _worker['table'], _worker['width'], _worker['height']
+    shapes1, shapes2 = _worker['shapes1'], _worker['shapes2']
+    found = 0
+
+    def value(state: State, move1: int, move2: int) -> Union[int, None]:
+        newState, result = fastGame.step(state, move1, move2)
+        if result is not None:
+            return _TERMINAL_VALUES[result]
+        index = shapes1.indexes[newState.body1] * shapes2.count + shapes2.indexes[newState.body2]
+        return table[HEADER.size + index]
+
+    # only results found on previous iterations are used,
+    # so values written during this iteration by other processes do not matter
+    def isWin(v):
+        return v == _TERMINAL_WIN or 0 < v < distance
+
+    def isLoss(v):
+        return v == _TERMINAL_LOSS or LOSS_OFFSET < v < LOSS_OFFSET + distance
+
+    for i1 in range(start, end):
+        body1 = shapes1.bodies[i1]
+        if body1 is None:
+            continue
+        offset = HEADER.size + i1 * shapes2.count
+        for i2, body2 in enumerate(shapes2.bodies):
+            current = table[offset + i2]
+            # already written by interrupted run of this iteration
+            if current == distance or current == LOSS_OFFSET + distance:
+                found += 1
+                continue
+            if current != DRAW_VALUE or body2 is None:
+                continue
+
+            state = State(width, height, body1, body2)
+            values = [[value(state, move1, move2) for move2 in fastGame.MOVES] for move1 in fastGame.MOVES]
+            if any(all(isWin(v) for v in row) for row in values):
+                table[offset + i2] = distance
+                found += 1
+            elif any(all(isLoss(row[move2]) for row in values) for move2 in fastGame.MOVES):
+                table[offset + i2] = LOSS_OFFSET + distance
+                found += 1
+
+    return found
+
+
+def _write_header(table: mmap.mmap, width, height, length1, length2, iterations, complete):
+    HEADER.pack_into(table, 0, MAGIC, VERSION, width, height, length1, length2, iterations, complete)
+    table.flush()
+
+
+def generate(path: str, width: int, height: int, length1: int, length2: int,
+             processes: int = None, chunks: int = 64):
+    """
+    Generate tablebase or continue interrupted generation
+    """
+    count1, count2 = shapes_count(width, height, length1), shapes_count(width, height, length2)
+
+    if not os.path.exists(path):
+        with open(path, 'wb') as file:
+            file.write(HEADER.pack(MAGIC, VERSION, width, height, length1, length2, 0, 0))
+            file.truncate(HEADER.size + count1 * count2)
+
+    table = _open_map(path, write=True)
+    header = _read_header(table)
+    if header[:4] != (width, height, length1, length2):
+        raise ValueError(f"{path} is a tablebase for other maze or lengths: {header[:4]}")
+    iterations, complete = header[4:]
+    if complete:
+        logging.info(f"{path} is already complete")
+        return
+
+    step = max(count1 // chunks, 1)
+    ranges = [(start, min(start + step, count1)) for start in range(0, count1, step)]
+
+    with multiprocessing.Pool(processes, initializer=_init_worker, initargs=(path,)) as pool:
+        # iteration 0 marks invalid positions
+        if iterations == 0:
+            pool.map(_mark_invalid, ranges)
+            iterations = 1
+            _write_header(table, width, height, length1, length2, iterations, 0)
+
+        for distance in range(iterations, MAX_DISTANCE + 1):
+            found = sum(pool.map(_solve_iteration, [(r, distance) for r in ranges]))
+            logging.info(f"Iteration {distance}: {found} positions with forced result")
+            _write_header(table, width, height, length1, length2, distance + 1, int(not found))
+            if not found:
+                break
+
+    table.close()
+
+
+class Tablebase:
+    """
+    Read-only memory-mapped tablebase
+
+    >>> tablebase = Tablebase('tablebase_6x6_3_3.tb')
+    >>> tablebase.probe(snake, opponent, mazeSize, apple, iteration)  # ('win', 5) or None if the table can not tell
+    """
+
+    def __init__(self, path: str):
+        self._map = _open_map(path, write=False)
+        self.width, self.height, self.length1, self.length2, _, self.complete = _read_header(self._map)
+        self._count2 = shapes_count(self.width, self.height, self.length2)
+
+    def _value(self, state: State) -> Union[int, None]:
+        if ((state.width, state.height, len(state.body1), len(state.body2))
+                != (self.width, self.height, self.length1, self.length2)):
+            return None
+        index = encode_shape(state.body1, self.width) * self._count2 + encode_shape(state.body2, self.width)
+        return self._map[HEADER.size + index]
+
+    def _table_result(self, state: State) -> Union[Tuple[str, int], None]:
+        """
+        Stored result of the position without apple
+        """
+        value = self._value(state)
+        if value is None or value == INVALID:
+            return None
+        if value == DRAW_VALUE:
+            return DRAW, 0
+        if value < LOSS_OFFSET:
+            return WIN, value
+        return LOSS, value - LOSS_OFFSET
+
+    def probe_state(self, state: State) -> Union[Tuple[str, int], None]:
+        """
+        Return result for the first snake and number of moves to it (0 for draw)
+        or None if the position is not in the table, a head can reach the apple
+        before the result or the result comes after the limit of iterations
+        """
+        result = self._table_result(state)
+        if result is None:
+            return None
+        kind, distance = result
+
+        # moves are made on iterations from state.iteration to MAX_GAME_ITERATIONS
+        remaining = constants.MAX_GAME_ITERATIONS - state.iteration + 1
+        if distance > remaining:
+            return None
+        if state.apple != fastGame.NO_APPLE:
+            # draw has to hold until the end of the game
+            horizon = remaining if kind == DRAW else distance
+            appleX, appleY = state.apple % self.width, state.apple // self.width
+            for head in (state.body1[0], state.body2[0]):
+                if abs(head % self.width - appleX) + abs(head // self.width - appleY) <= horizon:
+                    return None
+        return result
+
+    def probe(self, snake, opponent, mazeSize: Coordinate, apple: Coordinate,
+              iteration: int) -> Union[Tuple[str, int], None]:
+        """
+        Probe position for the snake (arguments are the same as in `IBot.chooseDirection`,
+        `iteration` is the number of the current game iteration)
+        """
+        return self.probe_state(fastGame.from_snakes(snake, opponent, mazeSize, apple, iteration))
+
+    def _move_value(self, state: State, move1: int) -> Tuple[int, int]:
+        """
+        Worst result of the move over all replies: (kind, distance)
+        where kind is 2 for win, 1 for draw, 0 for loss
+        """
+        worst = None
+        for move2 in fastGame.MOVES:
+            newState, result = fastGame.step(state, move1, move2)
+            if result is not None:
+                outcome = {fastGame.SNAKE1_WON: (2, 1), fastGame.SNAKE2_WON: (0, 1)}.get(result, (1, 0))
+            else:
+                # the apple can not be reached on the way to the result of the position
+                kind, distance = self._table_result(newState)
+                outcome = {WIN: (2, distance + 1), LOSS: (0, distance + 1), DRAW: (1, 0)}[kind]
+            # faster wins and slower losses are better
+            key = (outcome[0], -outcome[1] if outcome[0] == 2 else outcome[1])
+            if worst is None or key < worst:
+                worst = key
+        return worst
+
+    def best_move(self, state: State) -> Union[int, None]:
+        """
+        Return move of the first snake with the best guaranteed result
+        or None if `probe_state` can not tell the result of the position
+        """
+        if self.probe_state(state) is None:
+            return None
+        return max(fastGame.MOVES, key=lambda move: self._move_value(state, move))
+
+    def close(self):
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
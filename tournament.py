@@ -0,0 +1,431 @@
+"""
+Tournament distributed over several hosts.
+
+Coordinator splits the work list (every ordered pair of bots x seeds) into shards,
+leases them to workers over TCP and writes results as json lines.
+Jobs of a worker that disconnected or did not finish in time are leased again.
+
+Protocol: one json message per line.
+    worker      -> coordinator: {"type": "lease"}
+    coordinator -> worker:      {"type": "jobs", "jobs": [...]} | {"type": "wait", "delay": s} | {"type": "done"}
+    worker      -> coordinator: {"type": "result", "jobId": ..., "result": {...}}
+                              | {"type": "failure", "jobId": ..., "reason": ..., "retry": bool}
+    coordinator -> worker:      {"type": "ack"}
+Every game is played in a child process, which the worker kills after "timeout" seconds
+(a bit less than the lease), so a hung bot fails only its own game.
+A worker waits for "ack" before it plays the next game, and the coordinator sends it
+only after the result is queued for writing, so results never pile up in memory
+"""
+import argparse
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import random
+import socket
+import socketserver
+import threading
+import time
+from collections import Counter, deque
+from typing import Dict, List
+
+from playGame import play_one_game
+from src.importsTools import import_bot
+
+
+def file_hash(path: str) -> str:
+    with open(path, 'rb') as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+
+def send_message(file, message: dict):
+    file.write(json.dumps(message).encode() + b'\n')
+    file.flush()
+
+
+def receive_message(file) -> dict:
+    line = file.readline()
+    if not line:
+        raise ConnectionError("Connection closed")
+    return json.loads(line)
+
+
+def make_jobs(botPaths: List[str], seeds: int) -> List[dict]:
+    """
+    Return work list: every ordered pair of different bots with every seed
+    """
+    hashes = {path: file_hash(path) for path in botPaths}
+    return [
+        {
+            'jobId': f"{bot1}|{bot2}|{seed}",
+            'bot1': {'path': bot1, 'sha256': hashes[bot1]},
+            'bot2': {'path': bot2, 'sha256': hashes[bot2]},
+            'seed': seed,
+        }
+        for bot1 in botPaths
+        for bot2 in botPaths
+        if bot1 != bot2
+        for seed in range(seeds)
+    ]
+
+
+class Coordinator:
+    """
+    Leases jobs to workers and writes their results
+    """
+
+    def __init__(self, jobs: List[dict], output: str, shardSize=4, leaseTimeout=600,
+                 maxAttempts=3, maxPendingResults=64):
+        self.output = output
+        self.shardSize = shardSize
+        self.leaseTimeout = leaseTimeout
+        self.maxAttempts = maxAttempts
+
+        finished = self._read_finished()
+        self.pending = deque(job for job in jobs if job['jobId'] not in finished)
+        self.total = len(self.pending)
+        self.leases: Dict[str, dict] = {}  # jobId -> {'job', 'worker', 'deadline'}
+        self.attempts = Counter()
+        self.finished = 0
+
+        self.condition = threading.Condition()
+        # bounded, so workers block when results come faster than they are written
+        self.results = queue.Queue(maxsize=maxPendingResults)
+
+    def _read_finished(self) -> set:
+        """
+        Return ids of jobs that are already in output (to resume interrupted tournament).
+        Failed jobs are played again
+        """
+        if not os.path.exists(self.output):
+            return set()
+        with open(self.output) as file:
+            records = [json.loads(line) for line in file if line.strip()]
+        return {record['jobId'] for record in records if not record.get('failed')}
+
+    @property
+    def done(self) -> bool:
+        return self.finished == self.total
+
+    def _expire_leases(self):
+        now = time.time()
+        for jobId, lease in list(self.leases.items()):
+            if lease['deadline'] < now:
+                logging.warning(f"Lease of {jobId} by {lease['worker']} expired")
+                self._release(jobId, f"worker {lease['worker']} timed out")
+
+    def _release(self, jobId: str, reason: str):
+        """
+        Return leased job to the work list or fail it after too many attempts
+        """
+        lease = self.leases.pop(jobId)
+        if self.attempts[jobId] >= self.maxAttempts:
+            job = lease['job']
+            self.results.put({'jobId': jobId, 'failed': True, 'reason': reason,
+                              'bot1': job['bot1']['path'], 'bot2': job['bot2']['path'], 'seed': job['seed']})
+            self._count_finished(jobId)
+        else:
+            self.pending.appendleft(lease['job'])
+        self.condition.notify_all()
+
+    def _count_finished(self, jobId: str):
+        self.finished += 1
+        logging.info(f"Finished {self.finished}/{self.total}: {jobId}")
+        self.condition.notify_all()
+
+    def lease(self, worker: str) -> dict:
+        with self.condition:
+            self._expire_leases()
+            if self.done:
+                return {'type': 'done'}
+            if not self.pending:
+                return {'type': 'wait', 'delay': 1}
+
+            jobs = [self.pending.popleft() for _ in range(min(self.shardSize, len(self.pending)))]
+            deadline = time.time() + self.leaseTimeout * len(jobs)
+            for job in jobs:
+                self.attempts[job['jobId']] += 1
+                self.leases[job['jobId']] = {'job': job, 'worker': worker, 'deadline': deadline}
+            # worker kills the game before the lease expires
+            return {'type': 'jobs', 'jobs': jobs, 'timeout': self.leaseTimeout * 0.9}
+
+    def complete(self, worker: str, jobId: str, result: dict):
+        with self.condition:
+            # result of expired lease that is already leased to another worker
+            if self.leases.get(jobId, {}).get('worker') != worker:
+                return
+            lease = self.leases.pop(jobId)
+
+        job = lease['job']
+        # blocks while the writer is behind, without holding the lock
+        self.results.put({'jobId': jobId, 'bot1': job['bot1']['path'], 'bot2': job['bot2']['path'],
+                          'seed': job['seed'], 'worker': worker, **result})
+        with self.condition:
+            self._count_finished(jobId)
+
+    def fail(self, worker: str, jobId: str, reason: str, retry: bool = True):
+        with self.condition:
+            if self.leases.get(jobId, {}).get('worker') == worker:
+                logging.warning(f"{worker} failed {jobId}: {reason}")
+                if not retry:
+                    self.attempts[jobId] = self.maxAttempts
+                self._release(jobId, reason)
+
+    def disconnect(self, worker: str):
+        with self.condition:
+            for jobId, lease in list(self.leases.items()):
+                if lease['worker'] == worker:
+                    self._release(jobId, f"worker {worker} disconnected")
+
+    def _write_results(self):
+        with open(self.output, 'a') as file:
+            while True:
+                record = self.results.get()
+                if record is None:
+                    break
+                file.write(json.dumps(record) + '\n')
+                file.flush()
+                self.results.task_done()
+
+    def serve(self, host: str, port: int, ready: threading.Event = None):
+        """
+        Serve workers until all jobs are finished
+        """
+        coordinator = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                worker = f"{self.client_address[0]}:{self.client_address[1]}"
+                logging.info(f"Worker {worker} connected")
+                try:
+                    while True:
+                        message = receive_message(self.rfile)
+                        if message['type'] == 'lease':
+                            response = coordinator.lease(worker)
+                            send_message(self.wfile, response)
+                            if response['type'] == 'done':
+                                break
+                        elif message['type'] == 'result':
+                            coordinator.complete(worker, message['jobId'], message['result'])
+                            send_message(self.wfile, {'type': 'ack'})
+                        elif message['type'] == 'failure':
+                            coordinator.fail(worker, message['jobId'], message['reason'],
+                                             message.get('retry', True))
+                            send_message(self.wfile, {'type': 'ack'})
+                except (ConnectionError, OSError) as e:
+                    logging.warning(f"Worker {worker} lost: {e}")
+                finally:
+                    coordinator.disconnect(worker)
+
+        class Server(socketserver.ThreadingTCPServer):
+            allow_reuse_address = True
+            daemon_threads = True
+
+        server = Server((host, port), Handler)
+        self.address = server.server_address
+
+        writer = threading.Thread(target=self._write_results, daemon=True)
+        writer.start()
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        logging.info(f"Coordinator is listening on {self.address[0]}:{self.address[1]}, {self.total} jobs")
+        if ready:
+            ready.set()
+
+        with self.condition:
+            while not self.done:
+                self.condition.wait(timeout=1)
+                self._expire_leases()
+
+        self.results.join()
+        self.results.put(None)
+        writer.join()
+        server.shutdown()
+        server.server_close()
+
+
+def play_job(job: dict, root: str = '.') -> dict:
+    """
+    Verify bots and play one game of the job.
+    Return short result of the game
+    """
+    paths = []
+    for bot in (job['bot1'], job['bot2']):
+        path = os.path.join(root, bot['path'])
+        if file_hash(path) != bot['sha256']:
+            raise ValueError(f"Hash of {path} does not match the coordinator's one")
+        paths.append(path)
+
+    random.seed(job['seed'])
+    bot1, bot2 = import_bot(paths[0]), import_bot(paths[1])
+    metadata = play_one_game(bot1, bot2)['metadata']
+    return {key: metadata[key] for key in ('winner', 'description', 'score', 'result', 'gameId')}
+
+
+def _play_job_process(job: dict, root: str, connection):
+    try:
+        connection.send({'result': play_job(job, root)})
+    except Exception as e:
+        connection.send({'reason': e.__str__(), 'retry': True})
+
+
+def play_job_isolated(job: dict, root: str, timeout: float) -> dict:
+    """
+    Play the job in a child process and kill it after `timeout` seconds.
+    Return {'result': ...} or {'reason': ..., 'retry': ...}
+    """
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    # not daemonic, so bots may start their own processes
+    process = multiprocessing.Process(target=_play_job_process, args=(job, root, sender))
+    process.start()
+    sender.close()
+    try:
+        if receiver.poll(timeout):
+            return receiver.recv()
+        # the same bots would hang on another worker too
+        return {'reason': f"game did not finish in {timeout:.0f} seconds", 'retry': False}
+    except EOFError:
+        return {'reason': f"game process died with exit code {process.exitcode}", 'retry': True}
+    finally:
+        process.kill()
+        process.join()
+        receiver.close()
+
+
+def _play_leases(connection: socket.socket, root: str):
+    """
+    Play leased jobs until the coordinator replies "done"
+    """
+    file = connection.makefile('rwb')
+    while True:
+        send_message(file, {'type': 'lease'})
+        response = receive_message(file)
+        if response['type'] == 'done':
+            return
+        if response['type'] == 'wait':
+            time.sleep(response['delay'])
+            continue
+
+        for job in response['jobs']:
+            outcome = play_job_isolated(job, root, response['timeout'])
+            if 'result' in outcome:
+                message = {'type': 'result', 'jobId': job['jobId'], 'result': outcome['result']}
+            else:
+                message = {'type': 'failure', 'jobId': job['jobId'], **outcome}
+            send_message(file, message)
+            receive_message(file)  # ack
+
+
+def run_worker(host: str, port: int, root: str = '.', reconnectTimeout: float = 300):
+    """
+    Play leased jobs until the coordinator has no more work.
+    Lost connection is restored with growing delays (coordinator may be restarted),
+    the worker stops when the coordinator is not available for `reconnectTimeout` seconds
+    """
+    delay = 1
+    lostSince = None
+    while True:
+        try:
+            with socket.create_connection((host, port)) as connection:
+                lostSince, delay = None, 1
+                _play_leases(connection, root)
+                return
+        except OSError as e:
+            lostSince = lostSince or time.time()
+            if time.time() - lostSince >= reconnectTimeout:
+                logging.warning(f"Coordinator {host}:{port} is not available: {e}")
+                return
+            logging.warning(f"Connection to {host}:{port} failed: {e}. Reconnecting in {delay} seconds")
+            time.sleep(delay)
+            delay = min(delay * 2, 30)
+
+
+def run_workers(host: str, port: int, number: int, root: str = '.', reconnectTimeout: float = 300):
+    """
+    Run several worker processes (one per core by default)
+    """
+    # spawn, so workers do not inherit the listening socket of local coordinator
+    context = multiprocessing.get_context('spawn')
+    workers = [
+        context.Process(target=run_worker, args=(host, port, root, reconnectTimeout))
+        for _ in range(number or os.cpu_count())
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+def print_standings(output: str):
+    standings = {}
+    with open(output) as file:
+        for line in file:
+            record = json.loads(line)
+            if record.get('failed'):
+                continue
+            for bot, points in zip((record['bot1'], record['bot2']), record['result']):
+                wins, draws, losses = standings.get(bot, (0, 0, 0))
+                if record['winner'] == 0:
+                    draws += 1
+                elif points:
+                    wins += 1
+                else:
+                    losses += 1
+                standings[bot] = (wins, draws, losses)
+
+    for bot, (wins, draws, losses) in sorted(standings.items(), key=lambda item: -item[1][0]):
+        print(f"{bot}: {wins} wins, {draws} draws, {losses} losses")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest='mode', required=True)
+
+    coordinatorParser = subparsers.add_parser('coordinator', help='lease games to workers')
+    localParser = subparsers.add_parser('local', help='coordinator with workers on this host')
+    for subparser in (coordinatorParser, localParser):
+        subparser.add_argument('bots', nargs='+', help='paths to python files with Bot class')
+        subparser.add_argument('-s', '--seeds', type=int, default=1,
+                               help='number of games for every ordered pair of bots. default is 1')
+        subparser.add_argument('-o', '--output', default='tournament.jsonl',
+                               help='results in json lines. finished jobs are skipped on restart')
+        subparser.add_argument('--shard', type=int, default=4, help='number of jobs in one lease')
+        subparser.add_argument('--lease-timeout', type=float, default=600,
+                               help='seconds for one job before it is leased again. '
+                                    'workers kill games that are longer')
+        subparser.add_argument('--attempts', type=int, default=3, help='maximum attempts of one job')
+    coordinatorParser.add_argument('--host', default='0.0.0.0')
+    coordinatorParser.add_argument('--port', type=int, default=7777)
+    localParser.add_argument('-w', '--workers', type=int, help='default is number of cores')
+
+    workerParser = subparsers.add_parser('worker', help='play games leased by coordinator')
+    workerParser.add_argument('--host', default='127.0.0.1')
+    workerParser.add_argument('--port', type=int, default=7777)
+    workerParser.add_argument('-w', '--workers', type=int, help='default is number of cores')
+    workerParser.add_argument('--root', default='.', help='directory, bot paths are relative to')
+    workerParser.add_argument('--reconnect-timeout', type=float, default=300,
+                              help='seconds to wait for lost coordinator (e.g. restarted) before exit')
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.mode == 'worker':
+        run_workers(args.host, args.port, args.workers, args.root, args.reconnect_timeout)
+    else:
+        coordinator = Coordinator(
+            make_jobs(args.bots, args.seeds), args.output, shardSize=args.shard,
+            leaseTimeout=args.lease_timeout, maxAttempts=args.attempts)
+
+        if args.mode == 'coordinator':
+            coordinator.serve(args.host, args.port)
+        else:
+            ready = threading.Event()
+            thread = threading.Thread(target=coordinator.serve, args=('127.0.0.1', 0, ready))
+            thread.start()
+            ready.wait()
+            # coordinator in this process is closed only when all jobs are finished
+            run_workers(*coordinator.address, args.workers, reconnectTimeout=0)
+            thread.join()
+
+        print_standings(args.output)